@@ -2,6 +2,7 @@ import os.path
 import urllib.request, urllib.error
 import re
 import email
+import struct
 
 ssl = None
 try: import ssl
@@ -25,12 +26,36 @@ class Mailbox(object):
   host : str
     The host name of the anonbox service used.
   messages : list of email.message.Message
-    Messages received since the creation of the mailbox.
+    Messages received since the creation of the mailbox. Messages restored
+    by :meth:`~anonbox.Mailbox.loads` are only parsed when this is first
+    accessed.
+  rawmessages : list of str
+    The source text of `messages` as received, read-only.
   valid : bool
     Whether the mailbox is still available on the service and can receive
     messages.
+  cursor : int
+    The number of messages on the service that have already been fetched.
+  etag : str
+    The `ETag` validator of the last successful check, if any.
+  lastmodified : str
+    The `Last-Modified` validator of the last successful check, if any.
   """
 
+  # Serialized string attributes and the formats of their length prefixes
+  _FIELDS = [
+    ("datehash", "B"), ("privatekey", "B"), ("publickey", "B"), ("host", "B"),
+    ("etag", "H"), ("lastmodified", "H")
+  ]
+  # Magic, version, flags, cursor, field lengths, message count
+  _HEADER = struct.Struct("!2sBBI" + "".join(f for _, f in _FIELDS) + "I")
+  _MAGIC = b"AB"
+  _VERSION = 1
+  _FLAG_SSL = 1
+  _FLAG_VALID = 2
+  _FLAG_MESSAGES = 4
+  _FLAGS = _FLAG_SSL | _FLAG_VALID | _FLAG_MESSAGES
+
   def __init__(self, datehash, privatekey, publickey, host="anonbox.net",
     usessl=True, opener=None):
     """
@@ -62,7 +87,14 @@ class Mailbox(object):
     self.publickey = publickey
     self.host = host
 
-    self.messages = []
+    # Holds restored source text in place of messages until they are accessed
+    self._messages = []
+    self._unparsed = 0
+    # Maps the ids of received messages to the message and its source text
+    self._sources = {}
+    self.cursor = 0
+    self.etag = None
+    self.lastmodified = None
     self.valid = True
     self.protocol = "https" if usessl else "http"
 
@@ -131,6 +163,9 @@ class Mailbox(object):
     """
     Checks for new messages in the box. Returns a list of all new messages.
 
+    The request carries the `etag` and `lastmodified` validators of the last
+    check, so an unchanged mailbox costs neither a download nor parsing.
+
     In case the service returns a 404, the Mailbox instance is set as invalid.
     If the instance isn't `valid` anymore, calling this method will do nothing
     besides returning an empty `list`.
@@ -143,28 +178,284 @@ class Mailbox(object):
     if not self.valid:
       return []
 
+    req = urllib.request.Request("{}://{}/{}/{}".format(
+      self.protocol, self.host, self.datehash, self.publickey))
+    if self.etag:
+      req.add_header("If-None-Match", self.etag)
+    if self.lastmodified:
+      req.add_header("If-Modified-Since", self.lastmodified)
+
     try:
-      with self.opener.open("{}://{}/{}/{}".format(
-        self.protocol, self.host, self.datehash, self.publickey)) as res:
+      with self.opener.open(req) as res:
         if res.getcode() == 404:
           self.valid = False
           return []
         content = res.read().decode(res.info().get_content_charset() or "utf-8")
+        etag = res.info().get("ETag")
+        lastmodified = res.info().get("Last-Modified")
     except urllib.error.HTTPError as e:
+      if e.code == 304:
+        self.valid = True
+        return []
       self.valid = False
       return []
     self.valid = True
+    self.etag = etag
+    self.lastmodified = lastmodified
 
     if not "From " in content:
       return []
     messages = content.split("\nFrom ")
-    newmessages = [
-      email.message_from_string(data.split("\n", 1)[1])
-      for data in messages[len(self.messages):]
-    ]
-    self.messages += newmessages
+    newmessages = []
+    for data in messages[self.cursor:]:
+      raw = data.split("\n", 1)[1]
+      message = email.message_from_string(raw)
+      self._sources[id(message)] = (message, raw)
+      newmessages.append(message)
+    self.cursor = max(self.cursor, len(messages))
+    # Don't go through the property, restored messages stay unparsed
+    self._messages += newmessages
     return newmessages
 
+  @property
+  def messages(self):
+    """
+    Messages received since the creation of the mailbox.
+
+    Returns
+    -------
+    list of email.message.Message
+      The received messages.
+    """
+    if self._unparsed:
+      for i, v in enumerate(self._messages):
+        if isinstance(v, str):
+          message = email.message_from_string(v)
+          self._sources[id(message)] = (message, v)
+          self._messages[i] = message
+      self._unparsed = 0
+    return self._messages
+
+  @messages.setter
+  def messages(self, value):
+    self._messages = value
+    self._unparsed = 0
+    ids = set(id(m) for m in value)
+    self._sources = {k: v for k, v in self._sources.items() if k in ids}
+
+  def _source(self, message):
+    """
+    Get the source text of a message in `messages`, preferably as received,
+    since regenerating it may re-encode headers.
+    """
+    if isinstance(message, str):
+      return message
+    entry = self._sources.get(id(message))
+    if entry and entry[0] is message:
+      return entry[1]
+    return message.as_string()
+
+  @property
+  def rawmessages(self):
+    """
+    The source text of `messages` as received. Messages that weren't received
+    by this instance, or a restored one, are regenerated.
+
+    Returns
+    -------
+    list of str
+      The source text of the messages.
+    """
+    return [self._source(m) for m in self._messages]
+
+  def _pack(self, withmessages):
+    """Serialize the instance to a single record, see `dumps`."""
+    fields = [(getattr(self, k) or "").encode("utf-8") for k, _ in self._FIELDS]
+    for (name, fmt), field in zip(self._FIELDS, fields):
+      if len(field) >= 1 << (8 * struct.calcsize(fmt)):
+        raise ValueError("Mailbox {} is too long to serialize".format(name))
+    flags = (
+      (self._FLAG_SSL if self.protocol == "https" else 0)
+      | (self._FLAG_VALID if self.valid else 0)
+      | (self._FLAG_MESSAGES if withmessages else 0)
+    )
+    messages = []
+    if withmessages:
+      messages = [m.encode("utf-8") for m in self.rawmessages]
+    parts = [self._HEADER.pack(
+      self._MAGIC, self._VERSION, flags, self.cursor,
+      *([len(f) for f in fields] + [len(messages)])
+    )]
+    parts += fields
+    for m in messages:
+      parts.append(struct.pack("!I", len(m)))
+      parts.append(m)
+    return b"".join(parts)
+
+  @classmethod
+  def _unpack(cls, data, offset, openers):
+    """
+    Deserialize a single record starting at `offset`, see `loads`. `openers`
+    maps protocols to openers shared between the created instances.
+    Returns the instance and the offset after the record.
+    """
+    try:
+      header = cls._HEADER.unpack_from(data, offset)
+    except struct.error:
+      raise ValueError("Truncated mailbox record")
+    magic, version, flags, cursor = header[:4]
+    lengths, count = header[4:-1], header[-1]
+    if magic != cls._MAGIC:
+      raise ValueError("Not a serialized mailbox")
+    if version != cls._VERSION:
+      raise ValueError("Unsupported mailbox format version {}".format(version))
+    if flags & ~cls._FLAGS:
+      raise ValueError("Unknown mailbox flags {:#x}".format(flags))
+    if count and not flags & cls._FLAG_MESSAGES:
+      raise ValueError("Mailbox record has messages but no messages flag")
+    offset += cls._HEADER.size
+
+    fields = []
+    for length in lengths:
+      if offset + length > len(data):
+        raise ValueError("Truncated mailbox record")
+      fields.append(bytes(data[offset:offset + length]).decode("utf-8"))
+      offset += length
+    datehash, privatekey, publickey, host, etag, lastmodified = fields
+
+    usessl = bool(flags & cls._FLAG_SSL)
+    protocol = "https" if usessl else "http"
+    self = cls(datehash, privatekey, publickey, host=host, usessl=usessl,
+      opener=openers.get(protocol))
+    openers.setdefault(protocol, self.opener)
+    self.valid = bool(flags & cls._FLAG_VALID)
+    self.cursor = cursor
+    self.etag = etag or None
+    self.lastmodified = lastmodified or None
+
+    for i in range(count):
+      try:
+        length, = struct.unpack_from("!I", data, offset)
+      except struct.error:
+        raise ValueError("Truncated mailbox record")
+      offset += 4
+      if offset + length > len(data):
+        raise ValueError("Truncated mailbox record")
+      self._messages.append(bytes(data[offset:offset + length]).decode("utf-8"))
+      offset += length
+    self._unparsed = count
+    return self, offset
+
+  def dumps(self, withmessages=True):
+    """
+    Serializes the state of the mailbox to a compact binary representation.
+
+    The opener is not serialized.
+
+    Parameters
+    ----------
+    withmessages : bool
+      Include the received messages. If not, an instance restored from the
+      result will still only fetch new messages, but its `messages` will be
+      empty.
+
+    Returns
+    -------
+    bytes
+      The serialized mailbox, see :meth:`~anonbox.Mailbox.loads`.
+
+    Raises
+    ------
+    ValueError
+      If a key, the host or a validator is too long to be serialized.
+    """
+    return self._pack(withmessages)
+
+  @classmethod
+  def loads(cls, data, opener=None):
+    """
+    Restores a mailbox serialized with :meth:`~anonbox.Mailbox.dumps`.
+
+    Restored messages are kept as source text and only parsed when `messages`
+    is first accessed.
+
+    Parameters
+    ----------
+    data : bytes
+      The serialized mailbox.
+    opener : urllib.request.OpenerDirector
+      A custom opener that will be used to do all requests, see
+      :meth:`~anonbox.Mailbox.__init__`.
+
+    Returns
+    -------
+    anonbox.Mailbox
+      The restored instance.
+    """
+    openers = {"http": opener, "https": opener} if opener else {}
+    self, offset = cls._unpack(data, 0, openers)
+    if offset != len(data):
+      raise ValueError("Trailing data after mailbox record")
+    return self
+
+  @classmethod
+  def dumpsmany(cls, mailboxes, withmessages=True):
+    """
+    Serializes multiple mailboxes at once, see
+    :meth:`~anonbox.Mailbox.dumps`.
+
+    Parameters
+    ----------
+    mailboxes : iterable of anonbox.Mailbox
+      The mailboxes to serialize.
+    withmessages : bool
+      Include the received messages.
+
+    Returns
+    -------
+    bytes
+      The serialized mailboxes, see :meth:`~anonbox.Mailbox.loadsmany`.
+    """
+    records = [m._pack(withmessages) for m in mailboxes]
+    return struct.pack("!I", len(records)) + b"".join(records)
+
+  @classmethod
+  def loadsmany(cls, data, opener=None):
+    """
+    Restores multiple mailboxes serialized with
+    :meth:`~anonbox.Mailbox.dumpsmany`.
+
+    Unless `opener` is given, the restored instances share one default opener
+    per protocol.
+
+    Parameters
+    ----------
+    data : bytes
+      The serialized mailboxes.
+    opener : urllib.request.OpenerDirector
+      A custom opener that will be used to do all requests, see
+      :meth:`~anonbox.Mailbox.__init__`.
+
+    Returns
+    -------
+    list of anonbox.Mailbox
+      The restored instances.
+    """
+    data = memoryview(data)
+    try:
+      count, = struct.unpack_from("!I", data, 0)
+    except struct.error:
+      raise ValueError("Truncated mailbox batch")
+    offset = 4
+    openers = {"http": opener, "https": opener} if opener else {}
+    mailboxes = []
+    for i in range(count):
+      mailbox, offset = cls._unpack(data, offset, openers)
+      mailboxes.append(mailbox)
+    if offset != len(data):
+      raise ValueError("Trailing data after mailbox batch")
+    return mailboxes
+
   @property
   def address(self):
     """
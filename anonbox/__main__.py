@@ -4,6 +4,8 @@ import argparse
 import time
 import webbrowser
 import base64
+import json
+import email.header, email.errors
 
 # oh
 sys.path.insert(0, os.path.join(os.path.dirname(sys.modules[__name__].__file__), ".."))
@@ -11,6 +13,55 @@ import anonbox
 
 
 SHOWNHEADERS = ["From", "To", "Date", "Subject"]
+JSONFIELDS = ["address", "headers", "text", "raw"]
+
+def decodePayload(part):
+  """
+  Decode the payload of a non-multipart part.
+
+  Messages are parsed from already decoded text, so 7bit, 8bit and binary
+  payloads are returned as they are. Base64 and quoted-printable payloads are
+  decoded using the charset the part declares, replacing undecodable bytes.
+
+  Parameters
+  ----------
+  part : email.message.Message
+    The part to decode.
+
+  Returns
+  -------
+  str
+    The payload as a string.
+  """
+  payload = part.get_payload()
+  if isinstance(payload, str) and part.get("Content-Transfer-Encoding", "7bit") \
+    .strip().lower() in ("7bit", "8bit", "binary"):
+    return payload
+  payload = part.get_payload(decode=True) or b""
+  try:
+    return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+  except LookupError:
+    # Unknown charset
+    return payload.decode("utf-8", errors="replace")
+
+def decodeHeader(value):
+  """
+  Decode RFC 2047 encoded words in a header value.
+
+  Parameters
+  ----------
+  value : str
+    The header value.
+
+  Returns
+  -------
+  str
+    The decoded header value, or `value` itself if it can't be decoded.
+  """
+  try:
+    return str(email.header.make_header(email.header.decode_header(value)))
+  except (email.errors.HeaderParseError, LookupError, UnicodeError):
+    return str(value)
 
 def findPayload(message, type):
   """
@@ -29,17 +80,71 @@ def findPayload(message, type):
   str
     The payload as a string.
   """
-  charset = message.get_charset() or "utf-8"
   if message.is_multipart():
     for k in message.walk():
       contenttype = k.get_content_type()
       if contenttype == type:
-        return k.get_payload(decode=True).decode(charset), contenttype
+        return decodePayload(k), contenttype
     for k in message.walk():
       contenttype = k.get_content_type()
       if k.get_content_type() == message.get_default_type():
-        return k.get_payload(decode=True).decode(charset), contenttype
-  return message.get_payload(decode=True).decode(charset), message.get_content_type()
+        return decodePayload(k), contenttype
+  return decodePayload(message), message.get_content_type()
+
+def log(args, *values):
+  """
+  Print a status message, to stderr if stdout is used for structured output.
+
+  Parameters
+  ----------
+  args : argparse.Namespace
+    The program arguments parsed by argparse.
+  values
+    The values to print.
+  """
+  print(*values, file=sys.stderr if args.format == "jsonl" else sys.stdout)
+
+def toRecord(message, raw, address, fields):
+  """
+  Build a JSON-serializable record of a message. Only the requested fields are
+  computed, so the body isn't decoded unless `text` is asked for.
+
+  A field that fails to be computed is set to `None` and the reason is stored
+  in the `error` dict under the field name, so a single broken message doesn't
+  lose the others.
+
+  Parameters
+  ----------
+  message : email.message.Message
+    The message.
+  raw : str
+    The source text of the message.
+  address : str
+    The address of the mailbox the message was received by.
+  fields : list of str
+    The fields to include, a subset of `JSONFIELDS`.
+
+  Returns
+  -------
+  dict
+    The record.
+  """
+  record = {}
+  for field in fields:
+    try:
+      if field == "address":
+        record["address"] = address
+      elif field == "headers":
+        # A list of pairs keeps repeated headers and their order
+        record["headers"] = [[k, decodeHeader(v)] for k, v in message.items()]
+      elif field == "text":
+        record["text"] = findPayload(message, "text/plain")[0]
+      elif field == "raw":
+        record["raw"] = raw
+    except Exception as e:
+      record[field] = None
+      record.setdefault("error", {})[field] = str(e)
+  return record
 
 def create(args):
   """
@@ -55,11 +160,11 @@ def create(args):
   mailbox : anonbox.Mailbox
     The created Mailbox instance.
   """
-  print("Creating new mailbox...")
+  log(args, "Creating new mailbox...")
   mailbox = anonbox.Mailbox.create(host=args.host, usessl=not args.nossl)
-  print("Address:", mailbox.address)
-  print("Access URL:", mailbox.accessurl)
-  print("--mailbox {},{},{}\n".format(mailbox.datehash, mailbox.privatekey, mailbox.publickey))
+  log(args, "Address:", mailbox.address)
+  log(args, "Access URL:", mailbox.accessurl)
+  log(args, "--mailbox {},{},{}\n".format(mailbox.datehash, mailbox.privatekey, mailbox.publickey))
   return mailbox
 
 def check(args):
@@ -73,12 +178,32 @@ def check(args):
   """
   if not args.mailbox:
     args.mailbox = create(args)
-  print("Checking for messages...")
+  log(args, "Checking for messages...")
   newmessages = args.mailbox.check()
   if not args.mailbox.valid:
-    print("Mailbox was deleted")
+    log(args, "Mailbox was deleted")
+    return
+  log(args, "{} new messages".format(len(newmessages)))
+
+  if args.format == "jsonl":
+    rawmessages = args.mailbox.rawmessages[-len(newmessages):] if newmessages else []
+    address = args.mailbox.address
+    # Collect the whole poll cycle and write it at once, as UTF-8 regardless
+    # of the encoding of stdout
+    out = getattr(sys.stdout, "buffer", None)
+    data = "".join(
+      json.dumps(toRecord(v, raw, address, args.fields), ensure_ascii=out is None) + "\n"
+      for v, raw in zip(newmessages, rawmessages)
+    )
+    if out is None:
+      sys.stdout.write(data)
+      sys.stdout.flush()
+    else:
+      sys.stdout.flush()
+      out.write(data.encode("utf-8"))
+      out.flush()
     return
-  print("{} new messages".format(len(newmessages)))
+
   for i, v in enumerate(newmessages):
     print("====== {} ======".format(i))
     for h in SHOWNHEADERS:
@@ -139,7 +264,7 @@ def main(args=None):
   parser_create = subparsers.add_parser("create",
     help="create a mailbox and show the access keys"
   )
-  parser_create.set_defaults(func=create)
+  parser_create.set_defaults(func=create, format="text")
 
   parser_check = subparsers.add_parser("check",
     help="check a mailbox for new messages"
@@ -178,6 +303,17 @@ def main(args=None):
     help="open received messages in the browser (HTML messages may compromise your anonymity)",
     action="store_true", default=False
   )
+  add_argument([parser_check, parser_watch],
+    "--format", "-f",
+    help="output format, one JSON record per message with jsonl, defaults to text",
+    choices=["text", "jsonl"], action="store", default="text"
+  )
+  add_argument([parser_check, parser_watch],
+    "--fields",
+    help="comma-separated fields of the jsonl records, out of {}, defaults to address,headers,text".format(",".join(JSONFIELDS)),
+    type=lambda a: [f.strip() for f in a.split(",")], action="store", default=None,
+    metavar="FIELDS"
+  )
   add_argument([parser_watch],
     "--delay", "-d",
     help="delay between checks in seconds, defaults to 30",
@@ -185,6 +321,16 @@ def main(args=None):
   )
 
   args = parser.parse_args(args)
+  if "fields" in args:
+    if args.fields is None:
+      args.fields = ["address", "headers", "text"]
+    elif args.format != "jsonl":
+      parser.error("--fields requires --format jsonl")
+    for field in args.fields:
+      if field not in JSONFIELDS:
+        parser.error("invalid field: {}".format(field))
+    if args.browse and args.format == "jsonl":
+      parser.error("--browse can't be used with --format jsonl")
   if "func" in args:
     args.func(args)
   else:
@@ -0,0 +1,184 @@
+import email
+import email.message
+import io
+import struct
+import unittest
+import urllib.error
+
+import anonbox
+
+
+class Response(io.BytesIO):
+  """A minimal stand-in for the response returned by an opener."""
+
+  def __init__(self, body, headers=None):
+    super().__init__(body.encode("utf-8"))
+    self.headers = email.message.Message()
+    for k, v in (headers or {}).items():
+      self.headers[k] = v
+
+  def getcode(self):
+    return 200
+
+  def info(self):
+    return self.headers
+
+
+class Opener(object):
+  """Serves queued responses and records the requests made."""
+
+  def __init__(self, *responses):
+    self.responses = list(responses)
+    self.requests = []
+
+  def open(self, req):
+    self.requests.append(req)
+    res = self.responses.pop(0)
+    if isinstance(res, Exception):
+      raise res
+    return res
+
+
+def mailboxContent(*messages):
+  """Format messages the way the service serves them."""
+  return "\n".join("From x\n" + m for m in messages)
+
+
+def notModified():
+  return urllib.error.HTTPError("http://x", 304, "Not Modified", {}, None)
+
+
+ONE = "Subject: one\n\nfirst\n"
+TWO = "Subject: =?utf-8?q?caf=C3=A9?=\n\nsecond é\n"
+
+
+class SerializationTest(unittest.TestCase):
+
+  def makeMailbox(self, *messages):
+    opener = Opener(Response(mailboxContent(*messages), {"ETag": '"tag"'}))
+    mailbox = anonbox.Mailbox("abcde", "0123456789", "9876543210",
+      host="example.org", usessl=False, opener=opener)
+    mailbox.check()
+    return mailbox
+
+  def test_roundtrip(self):
+    mailbox = self.makeMailbox(ONE, TWO)
+    restored = anonbox.Mailbox.loads(mailbox.dumps(), opener=mailbox.opener)
+    self.assertEqual(restored.address, mailbox.address)
+    self.assertEqual(restored.accessurl, mailbox.accessurl)
+    self.assertEqual(restored.protocol, "http")
+    self.assertEqual(restored.cursor, 2)
+    self.assertEqual(restored.etag, '"tag"')
+    self.assertIsNone(restored.lastmodified)
+    self.assertTrue(restored.valid)
+    self.assertEqual(restored.rawmessages, [ONE, TWO])
+    self.assertEqual([m["Subject"] for m in restored.messages],
+      ["one", "=?utf-8?q?caf=C3=A9?="])
+
+  def test_roundtrip_without_messages(self):
+    mailbox = self.makeMailbox(ONE, TWO)
+    mailbox.valid = False
+    restored = anonbox.Mailbox.loads(mailbox.dumps(withmessages=False))
+    self.assertEqual(restored.cursor, 2)
+    self.assertFalse(restored.valid)
+    self.assertEqual(restored.messages, [])
+
+  def test_roundtrip_many(self):
+    first, second = self.makeMailbox(ONE), self.makeMailbox(ONE, TWO)
+    second.publickey = "aaaaaaaaaa"
+    restored = anonbox.Mailbox.loadsmany(
+      anonbox.Mailbox.dumpsmany([first, second]))
+    self.assertEqual([m.address for m in restored],
+      [first.address, second.address])
+    self.assertEqual([m.rawmessages for m in restored], [[ONE], [ONE, TWO]])
+    self.assertIs(restored[0].opener, restored[1].opener)
+
+    restored = anonbox.Mailbox.loadsmany(
+      anonbox.Mailbox.dumpsmany([first, second], withmessages=False))
+    self.assertEqual([m.rawmessages for m in restored], [[], []])
+    self.assertEqual(anonbox.Mailbox.loadsmany(
+      anonbox.Mailbox.dumpsmany([])), [])
+
+  def test_restored_messages_parsed_lazily(self):
+    mailbox = self.makeMailbox(ONE)
+    opener = Opener(Response(mailboxContent(ONE, TWO)))
+    restored = anonbox.Mailbox.loads(mailbox.dumps(), opener=opener)
+    new = restored.check()
+    self.assertEqual([m["Subject"] for m in new], ["=?utf-8?q?caf=C3=A9?="])
+    self.assertEqual(restored._unparsed, 1)
+    self.assertEqual(restored.rawmessages, [ONE, TWO])
+    self.assertEqual([m["Subject"] for m in restored.messages][0], "one")
+    self.assertIs(restored.messages[1], new[0])
+    self.assertEqual(restored._unparsed, 0)
+
+  def test_assigned_messages_are_serialized(self):
+    mailbox = anonbox.Mailbox.loads(self.makeMailbox(ONE, TWO).dumps())
+    other = email.message_from_string("Subject: other\n\nbody\n")
+    mailbox.messages = [other, other]
+    restored = anonbox.Mailbox.loads(mailbox.dumps())
+    self.assertEqual([m["Subject"] for m in restored.messages],
+      ["other", "other"])
+
+  def test_too_long(self):
+    mailbox = self.makeMailbox()
+    mailbox.host = "x" * 256
+    with self.assertRaisesRegex(ValueError, "host"):
+      mailbox.dumps()
+    mailbox.host = "x" * 255
+    self.assertEqual(anonbox.Mailbox.loads(mailbox.dumps()).host, mailbox.host)
+
+  def test_malformed(self):
+    data = self.makeMailbox(ONE).dumps()
+    for bad, message in [
+      (data[:-1], "Truncated"),
+      (data[:10], "Truncated"),
+      (data + b"x", "Trailing"),
+      (b"XX" + data[2:], "Not a serialized"),
+      (data[:2] + b"\x02" + data[3:], "version"),
+      (data[:3] + b"\x80" + data[4:], "flags"),
+      (data[:3] + b"\x00" + data[4:], "messages flag"),
+    ]:
+      with self.assertRaisesRegex(ValueError, message):
+        anonbox.Mailbox.loads(bad)
+
+  def test_malformed_many(self):
+    data = anonbox.Mailbox.dumpsmany([self.makeMailbox(ONE)])
+    with self.assertRaisesRegex(ValueError, "Truncated"):
+      anonbox.Mailbox.loadsmany(data[:2])
+    with self.assertRaisesRegex(ValueError, "Truncated"):
+      anonbox.Mailbox.loadsmany(data[:-1])
+    with self.assertRaisesRegex(ValueError, "Trailing"):
+      anonbox.Mailbox.loadsmany(data + b"x")
+    with self.assertRaisesRegex(ValueError, "Truncated"):
+      anonbox.Mailbox.loadsmany(struct.pack("!I", 2) + data[4:])
+
+
+class CheckTest(unittest.TestCase):
+
+  def test_conditional_request(self):
+    opener = Opener(
+      Response(mailboxContent(ONE), {"ETag": '"a"', "Last-Modified": "then"}),
+      notModified()
+    )
+    mailbox = anonbox.Mailbox("abcde", "0123456789", "9876543210",
+      usessl=False, opener=opener)
+    self.assertEqual(len(mailbox.check()), 1)
+    self.assertIsNone(opener.requests[0].get_header("If-none-match"))
+
+    self.assertEqual(mailbox.check(), [])
+    self.assertTrue(mailbox.valid)
+    self.assertEqual(opener.requests[1].get_header("If-none-match"), '"a"')
+    self.assertEqual(opener.requests[1].get_header("If-modified-since"), "then")
+    self.assertEqual(mailbox.cursor, 1)
+    self.assertEqual(len(mailbox.messages), 1)
+
+  def test_deleted(self):
+    opener = Opener(urllib.error.HTTPError("http://x", 404, "Not Found", {}, None))
+    mailbox = anonbox.Mailbox("abcde", "0123456789", "9876543210",
+      usessl=False, opener=opener)
+    self.assertEqual(mailbox.check(), [])
+    self.assertFalse(mailbox.valid)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,106 @@
+import argparse
+import email
+import io
+import json
+import sys
+import unittest
+
+import anonbox
+from anonbox import __main__ as cli
+
+from test_mailbox import Opener, Response, mailboxContent
+
+
+class DecodeTest(unittest.TestCase):
+
+  def test_8bit(self):
+    message = email.message_from_string(
+      "Content-Type: text/plain; charset=utf-8\n"
+      "Content-Transfer-Encoding: 8bit\n\ncafé €\n")
+    self.assertEqual(cli.decodePayload(message), "café €\n")
+
+  def test_base64(self):
+    message = email.message_from_string(
+      "Content-Type: text/plain; charset=iso-8859-1\n"
+      "Content-Transfer-Encoding: base64\n\nY2Fm6Q==\n")
+    self.assertEqual(cli.decodePayload(message), "café")
+
+  def test_unknown_charset(self):
+    message = email.message_from_string(
+      "Content-Type: text/plain; charset=bogus\n"
+      "Content-Transfer-Encoding: quoted-printable\n\ncaf=C3=A9\n")
+    self.assertEqual(cli.decodePayload(message), "café\n")
+
+  def test_multipart(self):
+    message = email.message_from_string(
+      'Content-Type: multipart/alternative; boundary="b"\n\n'
+      "--b\nContent-Type: text/html\n\n<p>hi</p>\n"
+      "--b\nContent-Type: text/plain; charset=utf-8\n\nhé\n--b--\n")
+    self.assertEqual(cli.findPayload(message, "text/plain"),
+      ("hé", "text/plain"))
+
+
+class RecordTest(unittest.TestCase):
+
+  def test_headers(self):
+    message = email.message_from_string(
+      "Received: a\nReceived: b\nSubject: =?utf-8?q?caf=C3=A9?=\n\nbody\n")
+    self.assertEqual(cli.toRecord(message, "", "", ["headers"]), {
+      "headers": [["Received", "a"], ["Received", "b"], ["Subject", "café"]]
+    })
+
+  def test_errors(self):
+    message = email.message_from_string("Subject: x\n\nbody\n")
+    def fail(*args, **kwargs):
+      raise RuntimeError("broken")
+    message.items = fail
+    message.get_payload = fail
+    record = cli.toRecord(message, "raw", "addr",
+      ["address", "headers", "text", "raw"])
+    self.assertEqual(record, {
+      "address": "addr", "headers": None, "text": None, "raw": "raw",
+      "error": {"headers": "broken", "text": "broken"}
+    })
+
+
+class JSONLTest(unittest.TestCase):
+
+  def test_check(self):
+    mailbox = anonbox.Mailbox("abcde", "0123456789", "9876543210",
+      usessl=False, opener=Opener(Response(mailboxContent(
+        "Subject: one\n\ncafé\n", "Subject: two\n\n€\n"))))
+    args = argparse.Namespace(mailbox=mailbox, format="jsonl",
+      fields=["address", "text", "raw"], browse=False)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = io.TextIOWrapper(io.BytesIO(), encoding="cp1252")
+    sys.stderr = io.StringIO()
+    try:
+      cli.check(args)
+      output = sys.stdout.buffer.getvalue().decode("utf-8")
+    finally:
+      sys.stdout, sys.stderr = stdout, stderr
+
+    self.assertEqual([json.loads(l) for l in output.splitlines()], [
+      {"address": mailbox.address, "text": "café\n",
+        "raw": "Subject: one\n\ncafé\n"},
+      {"address": mailbox.address, "text": "€\n", "raw": "Subject: two\n\n€\n"},
+    ])
+
+  def test_arguments(self):
+    stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    try:
+      for args in (
+        ["check", "--fields", "raw"],
+        ["check", "-f", "jsonl", "--fields", "raw, bogus"],
+        ["watch", "-f", "jsonl", "--browse"],
+      ):
+        with self.assertRaises(SystemExit):
+          cli.main(args)
+    finally:
+      sys.stderr = stderr
+
+
+if __name__ == "__main__":
+  unittest.main()